@@ -0,0 +1,316 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from loguru import logger
+
+
+DEFAULT_COMPLEXITY = 1
+DEFAULT_PIXELS = 1280 * 1280
+COST_UNIT_PIXELS = 1_000_000
+MAX_TRACKED_CHATS = 1000
+
+
+def photo_pixels(msg):
+    """
+    Pixel count of the largest size of a photo message, as reported by Telegram.
+    """
+    if msg.get('photo'):
+        largest = msg['photo'][-1]
+        return largest.get('width', 0) * largest.get('height', 0) or DEFAULT_PIXELS
+    return DEFAULT_PIXELS
+
+
+def estimate_cost(pixels, complexity=DEFAULT_COMPLEXITY):
+    """
+    Estimate the work of processing an image, in megapixel x filter-complexity units.
+    """
+    return max(pixels / COST_UNIT_PIXELS, 0.01) * complexity
+
+
+class TokenBucket:
+    """
+    Classic token bucket: holds up to `capacity` tokens and refills at `rate` tokens per second.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.updated_at = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def available(self):
+        self._refill()
+        return self.tokens
+
+    def try_consume(self, amount):
+        self._refill()
+        if amount <= self.tokens:
+            self.tokens -= amount
+            return True
+        return False
+
+    def seconds_until(self, amount):
+        """
+        How long until `amount` tokens are available (inf if it exceeds the capacity).
+        """
+        self._refill()
+        if amount > self.capacity:
+            return float('inf')
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+
+class QueueWaitStats:
+    """
+    Per-chat queue wait time metrics, kept for the `max_chats` most recently active chats.
+    """
+
+    def __init__(self, max_chats=MAX_TRACKED_CHATS):
+        self.max_chats = max_chats
+        self._lock = threading.Lock()
+        self._stats = OrderedDict()
+
+    def _chat(self, chat_id):
+        stats = self._stats.get(chat_id)
+        if stats is None:
+            stats = self._stats[chat_id] = {'jobs': 0, 'total_wait': 0.0, 'max_wait': 0.0, 'rejected': 0, 'deferred': 0}
+            if len(self._stats) > self.max_chats:
+                self._stats.popitem(last=False)
+        else:
+            self._stats.move_to_end(chat_id)
+        return stats
+
+    def record_wait(self, chat_id, wait):
+        with self._lock:
+            stats = self._chat(chat_id)
+            stats['jobs'] += 1
+            stats['total_wait'] += wait
+            stats['max_wait'] = max(stats['max_wait'], wait)
+
+    def record_rejected(self, chat_id):
+        with self._lock:
+            self._chat(chat_id)['rejected'] += 1
+
+    def record_deferred(self, chat_id):
+        with self._lock:
+            self._chat(chat_id)['deferred'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                str(chat_id): {
+                    **stats,
+                    'avg_wait': stats['total_wait'] / stats['jobs'] if stats['jobs'] else 0.0,
+                }
+                for chat_id, stats in self._stats.items()
+            }
+
+
+class FairScheduler:
+    """
+    Weighted fair queuing across chats.
+
+    Each job gets a virtual finish time of max(virtual clock, chat's last finish) + cost / weight,
+    and the job with the smallest finish time runs next on one of `max_workers` worker threads,
+    so submitting never blocks on image work and a busy chat cannot starve the others.
+    """
+
+    def __init__(self, max_workers=2, stats=None, clock=time.monotonic):
+        self.max_workers = max_workers
+        self.stats = stats or QueueWaitStats()
+        self.clock = clock
+        self.weights = {}
+        self._lock = threading.Lock()
+        self._work_ready = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._queue = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish = {}
+        self._running = 0
+        self._workers = []
+        self._stopping = False
+
+    def start(self):
+        """
+        Start the worker threads; jobs submitted before this wait in the queue.
+        """
+        with self._lock:
+            if self._workers:
+                return
+            self._stopping = False
+            self._workers = [threading.Thread(target=self._work, name=f'fair-scheduler-{i}', daemon=True)
+                             for i in range(self.max_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def stop(self):
+        """
+        Let the workers finish the queued jobs and exit.
+        """
+        with self._lock:
+            self._stopping = True
+            workers, self._workers = self._workers, []
+            self._work_ready.notify_all()
+        for worker in workers:
+            worker.join()
+
+    def join(self, timeout=None):
+        """
+        Wait until the queue is empty and no job is running. Returns False on timeout.
+        """
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._queue and not self._running, timeout)
+
+    def pending(self, chat_id=None):
+        with self._lock:
+            if chat_id is None:
+                return len(self._queue)
+            return sum(1 for entry in self._queue if entry[2] == chat_id)
+
+    def running(self):
+        with self._lock:
+            return self._running
+
+    def set_weight(self, chat_id, weight):
+        with self._lock:
+            self.weights[chat_id] = weight
+
+    def submit(self, chat_id, cost, job, on_deferred=None):
+        """
+        Enqueue `job` for `chat_id` and return without waiting for it.
+        `on_deferred` is called when every worker is busy, so the job has to wait its turn.
+        """
+        with self._lock:
+            weight = self.weights.get(chat_id, 1.0)
+            start = max(self._virtual_time, self._last_finish.get(chat_id, 0.0))
+            finish = start + cost / weight
+            self._last_finish[chat_id] = finish
+            heapq.heappush(self._queue, (finish, next(self._sequence), chat_id, self.clock(), job))
+            deferred = self._running + len(self._queue) > self.max_workers
+            self._work_ready.notify()
+
+        if deferred:
+            self.stats.record_deferred(chat_id)
+            if on_deferred:
+                on_deferred()
+        return deferred
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._stopping:
+                    self._work_ready.wait()
+                if not self._queue:
+                    return
+                finish, _, chat_id, enqueued_at, job = heapq.heappop(self._queue)
+                self._virtual_time = max(self._virtual_time, finish)
+                # Once the chat's last queued job starts, max(virtual clock, last finish) is the
+                # virtual clock again, so its entry carries no information
+                if self._last_finish.get(chat_id, 0.0) <= self._virtual_time:
+                    self._last_finish.pop(chat_id, None)
+                self._running += 1
+
+            self.stats.record_wait(chat_id, self.clock() - enqueued_at)
+            try:
+                job()
+            except Exception:
+                logger.exception(f"Scheduled job for chat {chat_id} failed")
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._idle.notify_all()
+
+
+class AdmissionController:
+    """
+    Per-chat token buckets in front of the fair scheduler.
+    """
+
+    def __init__(self, rate=2.0, burst=20.0, max_pending_per_chat=10, max_workers=2, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_pending_per_chat = max_pending_per_chat
+        self.clock = clock
+        self.stats = QueueWaitStats()
+        self.scheduler = FairScheduler(max_workers=max_workers, stats=self.stats, clock=clock)
+        self._buckets = {}
+        self._sweep_at = MAX_TRACKED_CHATS
+        self._lock = threading.Lock()
+
+    def _bucket(self, chat_id):
+        # Called with self._lock held, so a sweep can't drop a bucket that is about to be charged
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) >= self._sweep_at:
+                self._drop_full_buckets()
+            bucket = self._buckets[chat_id] = TokenBucket(self.rate, self.burst, clock=self.clock)
+        return bucket
+
+    def _drop_full_buckets(self):
+        """
+        A bucket that has refilled to capacity is the same as a new one, so it can be dropped.
+        Sweeps happen when the number of buckets doubles, which keeps them amortized O(1).
+        """
+        self._buckets = {chat_id: bucket for chat_id, bucket in self._buckets.items()
+                         if bucket.available() < bucket.capacity}
+        self._sweep_at = max(MAX_TRACKED_CHATS, 2 * len(self._buckets))
+
+    def admit(self, chat_id, cost, jobs=1):
+        """
+        Charge `cost` for `jobs` queued jobs to the chat's bucket.
+        Returns (admitted, retry_after_seconds).
+        """
+        if self.scheduler.pending(chat_id) + jobs > self.max_pending_per_chat:
+            self.stats.record_rejected(chat_id)
+            return False, None
+
+        # A single job bigger than the whole bucket is admitted once the bucket is full.
+        charge = min(cost, self.burst)
+        with self._lock:
+            bucket = self._bucket(chat_id)
+            if bucket.try_consume(charge):
+                return True, 0.0
+            retry_after = bucket.seconds_until(charge)
+
+        self.stats.record_rejected(chat_id)
+        return False, retry_after
+
+    def precheck(self, chat_id, cost):
+        """
+        Check, without charging anything, that the chat has room in the queue and at least
+        `cost` tokens left, so work that is charged later isn't accepted from a flooding chat.
+        Returns (admitted, retry_after_seconds).
+        """
+        if self.scheduler.pending(chat_id) >= self.max_pending_per_chat:
+            self.stats.record_rejected(chat_id)
+            return False, None
+
+        charge = min(cost, self.burst)
+        with self._lock:
+            bucket = self._bucket(chat_id)
+            if bucket.available() >= charge:
+                return True, 0.0
+            retry_after = bucket.seconds_until(charge)
+
+        self.stats.record_rejected(chat_id)
+        return False, retry_after
+
+    def start(self):
+        self.scheduler.start()
+
+    def stop(self):
+        self.scheduler.stop()
+
+    def join(self, timeout=None):
+        return self.scheduler.join(timeout)
+
+    def submit(self, chat_id, cost, job, on_deferred=None):
+        return self.scheduler.submit(chat_id, cost, job, on_deferred=on_deferred)
@@ -2,6 +2,8 @@ import flask
 from flask import request
 import os
 from polybot.bot import ImageProcessingBot
+from polybot.codec import DEFAULT_JPEG_QUALITY
+from polybot.tracing import tracer, SpanKind, init_tracing, extract_context
 import requests
 
 app = flask.Flask(__name__)
@@ -10,9 +12,15 @@ app = flask.Flask(__name__)
 TELEGRAM_BOT_TOKEN = os.environ['TELEGRAM_BOT_TOKEN']
 BOT_APP_URL = os.environ.get('BOT_APP_URL')
 YOLO_SERVICE_URL = os.environ['YOLO_SERVICE_URL']
+MAX_IMAGE_SIZE = int(os.environ.get('MAX_IMAGE_SIZE', 1280))
+JPEG_QUALITY = int(os.environ.get('JPEG_QUALITY', DEFAULT_JPEG_QUALITY))
+
+# ✅ Init tracing before the bot so startup calls are traced too
+init_tracing()
 
 # ✅ Init bot
-bot = ImageProcessingBot(TELEGRAM_BOT_TOKEN, BOT_APP_URL, YOLO_SERVICE_URL)
+bot = ImageProcessingBot(TELEGRAM_BOT_TOKEN, BOT_APP_URL, YOLO_SERVICE_URL,
+                         max_image_size=MAX_IMAGE_SIZE, jpeg_quality=JPEG_QUALITY)
 
 processed_update_ids = set()
 
@@ -24,28 +32,46 @@ def index():
 def health():
     return 'ok', 200
 
+@app.route('/admission-stats', methods=['GET'])
+def admission_stats():
+    """Per-chat queue wait time and rejection counters"""
+    return flask.jsonify(bot.admission.stats.snapshot()), 200
+
 # ✅ Route must match Telegram webhook URL
 @app.route(f'/{TELEGRAM_BOT_TOKEN}/', methods=['POST'])
 def webhook():
     req = request.get_json()
     update_id = req.get("update_id")
 
-    if update_id in processed_update_ids:
-        print(f"🔁 Skipping duplicate update: {update_id}")
-        return 'Duplicate ignored', 200
+    with tracer.start_as_current_span('webhook', kind=SpanKind.SERVER, attributes={'telegram.update_id': update_id}) as span:
+        if update_id in processed_update_ids:
+            print(f"🔁 Skipping duplicate update: {update_id}")
+            span.set_attribute('telegram.duplicate', True)
+            return 'Duplicate ignored', 200
 
-    print(f"📩 Processing new update: {update_id}")
-    processed_update_ids.add(update_id)
+        print(f"📩 Processing new update: {update_id}")
+        processed_update_ids.add(update_id)
 
-    if 'message' in req:
-        bot.handle_message(req['message'])
+        if 'message' in req:
+            bot.handle_message(req['message'])
 
-    return 'Ok', 200
+        return 'Ok', 200
 
 
 @app.route('/yolo-result', methods=['POST'])
 def receive_yolo_result():
     """Endpoint to receive YOLO processing results"""
+    # The YOLO service echoes back the trace_context we put in the SQS message
+    payload = request.get_json(silent=True)
+    payload = payload if isinstance(payload, dict) else {}
+    parent = extract_context(payload.get('trace_context'))
+
+    with tracer.start_as_current_span('yolo_result', context=parent, kind=SpanKind.SERVER,
+                                      attributes={'prediction_id': str(payload.get('prediction_id', 'unknown'))}):
+        return _receive_yolo_result()
+
+
+def _receive_yolo_result():
     try:
         data = request.get_json()
 
@@ -74,11 +100,12 @@ def receive_yolo_result():
 
             # Try to get the processed image from YOLO service
             try:
-                image_response = requests.get(
-                    f"{YOLO_SERVICE_URL}/prediction/{prediction_id}/image",
-                    headers={"Accept": "image/jpeg"},
-                    timeout=10
-                )
+                with tracer.start_as_current_span('yolo.fetch_image', kind=SpanKind.CLIENT):
+                    image_response = requests.get(
+                        f"{YOLO_SERVICE_URL}/prediction/{prediction_id}/image",
+                        headers={"Accept": "image/jpeg"},
+                        timeout=10
+                    )
 
                 if image_response.status_code == 200:
                     # Save temporarily and send
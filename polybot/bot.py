@@ -1,3 +1,4 @@
+import functools
 import string
 import threading
 import telebot
@@ -10,6 +11,9 @@ import json
 import uuid
 from telebot.types import InputFile
 from polybot.img_proc import Img
+from polybot.filters import FilterError, available_filters, parse_caption
+from polybot.admission import AdmissionController, DEFAULT_COMPLEXITY, estimate_cost, photo_pixels
+from polybot.tracing import tracer, SpanKind, bind_context, inject_context, mark_error
 from datetime import datetime, timezone
 
 
@@ -54,16 +58,17 @@ class Bot:
             raise RuntimeError("Message content of type 'photo' expected")
 
         try:
-            file_info = self.telegram_bot_client.get_file(msg['photo'][-1]['file_id'])
-            data = self.telegram_bot_client.download_file(file_info.file_path)
-            folder_name = file_info.file_path.split('/')[0]
+            with tracer.start_as_current_span('telegram.download_photo'):
+                file_info = self.telegram_bot_client.get_file(msg['photo'][-1]['file_id'])
+                data = self.telegram_bot_client.download_file(file_info.file_path)
+                folder_name = file_info.file_path.split('/')[0]
 
-            os.makedirs(folder_name, exist_ok=True)
+                os.makedirs(folder_name, exist_ok=True)
 
-            with open(file_info.file_path, 'wb') as photo:
-                photo.write(data)
+                with open(file_info.file_path, 'wb') as photo:
+                    photo.write(data)
 
-            return file_info.file_path
+                return file_info.file_path
 
         except OSError as e:
             logger.error(f"File saving error: {e}")
@@ -88,10 +93,16 @@ class QuoteBot(Bot):
 
 
 class ImageProcessingBot(Bot):
-    def __init__(self, token, telegram_chat_url, yolo_service_url='http://localhost:8080'):
+    def __init__(self, token, telegram_chat_url, yolo_service_url='http://localhost:8080',
+                 max_image_size=None, jpeg_quality=None):
         super().__init__(token, telegram_chat_url)
         self.media_groups = {}
         self.yolo_service_url = yolo_service_url
+        # Photos are downscaled to at most max_image_size per side before filtering
+        self.max_image_size = max_image_size
+        self.jpeg_quality = jpeg_quality
+        self.admission = AdmissionController()
+        self.admission.start()
 
         # Initialize SQS for async communication
         self.sqs = boto3.client('sqs', region_name='us-east-2')
@@ -120,14 +131,19 @@ class ImageProcessingBot(Bot):
             return None
 
         s3 = boto3.client('s3')
-        try:
-            logger.info(f"⬆️ Uploading {local_path} to s3://{bucket_name}/{s3_key}")
-            s3.upload_file(local_path, bucket_name, s3_key)
-            logger.info("✅ File uploaded to S3.")
-            return f"s3://{bucket_name}/{s3_key}"
-        except Exception as e:
-            logger.error(f"❌ Upload to S3 failed: {e}")
-            return None
+        with tracer.start_as_current_span('s3.upload', kind=SpanKind.CLIENT, attributes={
+            'aws.s3.bucket': bucket_name,
+            'aws.s3.key': s3_key,
+        }) as span:
+            try:
+                logger.info(f"⬆️ Uploading {local_path} to s3://{bucket_name}/{s3_key}")
+                s3.upload_file(local_path, bucket_name, s3_key)
+                logger.info("✅ File uploaded to S3.")
+                return f"s3://{bucket_name}/{s3_key}"
+            except Exception as e:
+                logger.error(f"❌ Upload to S3 failed: {e}")
+                mark_error(e, span)
+                return None
 
     def send_to_yolo_queue(self, chat_id, s3_image_url, prediction_id):
         """Send message to SQS queue for YOLO processing"""
@@ -135,36 +151,104 @@ class ImageProcessingBot(Bot):
             logger.error("❌ SQS queue not available")
             return False
 
-        try:
-            message_body = {
-                "type": "yolo_request",
-                "chat_id": chat_id,
-                "image_url": s3_image_url,
-                "prediction_id": prediction_id,
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                "callback_url": f"{os.getenv('BOT_APP_URL')}/yolo-result"
-            }
-
-            response = self.sqs.send_message(
-                QueueUrl=self.queue_url,
-                MessageBody=json.dumps(message_body),
-                MessageAttributes={
+        with tracer.start_as_current_span('sqs.send yolo_request', kind=SpanKind.PRODUCER, attributes={
+            'messaging.system': 'aws_sqs',
+            'messaging.destination.name': self.queue_name,
+            'prediction_id': prediction_id,
+        }) as span:
+            try:
+                # The YOLO service echoes trace_context back in its /yolo-result callback
+                trace_context = inject_context()
+                message_body = {
+                    "type": "yolo_request",
+                    "chat_id": chat_id,
+                    "image_url": s3_image_url,
+                    "prediction_id": prediction_id,
+                    "trace_context": trace_context,
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "callback_url": f"{os.getenv('BOT_APP_URL')}/yolo-result"
+                }
+
+                message_attributes = {
                     'MessageType': {
                         'StringValue': 'yolo_request',
                         'DataType': 'String'
                     }
                 }
-            )
+                for key, value in trace_context.items():
+                    message_attributes[key] = {'StringValue': value, 'DataType': 'String'}
 
-            logger.info(f"✅ YOLO request sent to SQS: {response['MessageId']}")
-            return True
+                response = self.sqs.send_message(
+                    QueueUrl=self.queue_url,
+                    MessageBody=json.dumps(message_body),
+                    MessageAttributes=message_attributes
+                )
 
-        except Exception as e:
-            logger.error(f"❌ Failed to send to SQS: {e}")
-            return False
+                span.set_attribute('messaging.message.id', response['MessageId'])
+                logger.info(f"✅ YOLO request sent to SQS: {response['MessageId']}")
+                return True
+
+            except Exception as e:
+                logger.error(f"❌ Failed to send to SQS: {e}")
+                mark_error(e, span)
+                return False
+
+    def _caption_of(self, msg):
+        return msg.get('caption', '').strip().lower().strip(string.punctuation)
+
+    def _complexity_of(self, caption):
+        if not caption or caption == 'yolo':
+            return DEFAULT_COMPLEXITY
+        try:
+            spec, params = parse_caption(caption)
+        except FilterError:
+            return DEFAULT_COMPLEXITY
+        return spec.cost(**params)
 
     def handle_message(self, msg):
         chat_id = msg['chat']['id']
+
+        if not self.is_current_msg_photo(msg):
+            self._handle_message(msg)
+            return
+
+        pixels = photo_pixels(msg)
+        cost = estimate_cost(pixels, self._complexity_of(self._caption_of(msg)))
+
+        # Telegram puts an album's caption on its first photo only, so albums are charged as a whole
+        # when the group is flushed; each photo is still checked before it is downloaded.
+        if msg.get('media_group_id'):
+            admitted, retry_after = self.admission.precheck(chat_id, cost)
+            if admitted:
+                self._handle_message(msg, pixels)
+            else:
+                logger.warning(f"🚦 Rejected album photo from chat {chat_id} (retry after {retry_after})")
+                self._add_to_media_group(msg, retry_after=retry_after)
+            return
+
+        admitted, retry_after = self.admission.admit(chat_id, cost)
+        if not admitted:
+            logger.warning(f"🚦 Rejected photo from chat {chat_id} (cost {cost:.2f}, retry after {retry_after})")
+            self._reply_rejected(chat_id, retry_after)
+            return
+
+        self.admission.submit(
+            chat_id, cost, bind_context(lambda: self._handle_message(msg, pixels)),
+            on_deferred=lambda: self.send_text(chat_id, "⏳ I'm busy with other images right now, yours is queued and will be processed shortly.")
+        )
+
+    def _reply_rejected(self, chat_id, retry_after, what='images'):
+        if retry_after is None:
+            self.send_text(chat_id, "You have too many images waiting already. Please wait for them to finish and try again.")
+        else:
+            self.send_text(chat_id, f"You're sending {what} faster than I can process them. Please try again in {max(1, round(retry_after))} seconds.")
+
+    def _handle_message(self, msg, pixels=None):
+        with tracer.start_as_current_span('handle_message', attributes={'chat.id': msg['chat']['id']}):
+            self._dispatch_message(msg, pixels)
+
+    def _dispatch_message(self, msg, pixels=None):
+        chat_id = msg['chat']['id']
         logger.info(f'Incoming message: {msg}')
 
         if 'text' in msg and msg['text'].strip().lower() == 'hi':
@@ -177,25 +261,11 @@ class ImageProcessingBot(Bot):
             except Exception:
                 return
 
-            caption = msg.get('caption', '').strip().lower().strip(string.punctuation)
+            caption = self._caption_of(msg)
             logger.info(f"📸 Caption received: '{caption}'")
 
-            media_group_id = msg.get('media_group_id')
-            if media_group_id:
-                group = self.media_groups.setdefault(media_group_id, {
-                    'chat_id': chat_id,
-                    'photos': [],
-                    'filter': caption if caption else None,
-                    'timer': None
-                })
-                group['photos'].append(photo_path)
-                if caption:
-                    group['filter'] = caption
-                if group['timer']:
-                    group['timer'].cancel()
-                timer = threading.Timer(2.0, self._process_media_group, args=(media_group_id,))
-                group['timer'] = timer
-                timer.start()
+            if msg.get('media_group_id'):
+                self._add_to_media_group(msg, photo=(photo_path, pixels or photo_pixels(msg)))
                 return
 
             if not caption:
@@ -211,115 +281,152 @@ class ImageProcessingBot(Bot):
         self.send_text(chat_id, "Please send a photo with a caption indicating the filter to apply.")
 
     def apply_filter_from_caption(self, chat_id, photo_path, caption):
-        img = Img(photo_path)
-        try:
-            if caption == 'blur':
-                img.blur()
-            elif caption == 'rotate':
-                img.rotate()
-            elif caption in ('salt and pepper', 'salt_n_pepper'):
-                img.salt_n_pepper()
-            elif caption == 'contour':
-                img.contour()
-            elif caption == 'segment':
-                img.segment()
-            else:
-                self.send_text(chat_id, f"Unknown filter '{caption}'.")
+        with tracer.start_as_current_span('apply_filter', attributes={'filter.name': caption}) as span:
+            try:
+                spec, params = parse_caption(caption)
+            except FilterError as e:
+                self.send_text(chat_id, f"{e}\nAvailable filters: {', '.join(available_filters())}")
                 return
 
-            filtered_path = img.save_img()
-            logger.info(f"🖼️ Filter applied: {caption} → Saved locally at {filtered_path}")
-            self.send_photo(chat_id, str(filtered_path))
+            img = Img(photo_path, max_size=self.max_image_size)
+            try:
+                spec.apply(img, **params)
+
+                filtered_path = img.save_img(quality=self.jpeg_quality)
+                logger.info(f"🖼️ Filter applied: {caption} → Saved locally at {filtered_path}")
+                self.send_photo(chat_id, str(filtered_path))
 
-        except Exception:
-            logger.exception("Filter application failed")
-            self.send_text(chat_id, "Failed to apply the selected filter.")
+            except Exception as e:
+                logger.exception("Filter application failed")
+                mark_error(e, span)
+                self.send_text(chat_id, "Failed to apply the selected filter.")
 
     def apply_yolo_async(self, chat_id, photo_path):
         """Apply YOLO detection using async SQS communication"""
-        try:
-            bucket_name = os.getenv("S3_BUCKET_NAME")
-            if not bucket_name:
-                self.send_text(chat_id, "S3 bucket not configured. Contact admin.")
-                return
-
-            user_id = chat_id
-            timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
-            prediction_id = str(uuid.uuid4())
-
-            # Upload image to S3
-            s3_key = f"images/{user_id}/{timestamp}-{os.path.basename(photo_path)}"
-            s3_image_url = self.upload_file_to_s3(photo_path, bucket_name, s3_key)
-
-            if not s3_image_url:
-                self.send_text(chat_id, "Failed to upload image. Please try again.")
-                return
-
-            # Send to YOLO queue for async processing
-            if self.send_to_yolo_queue(chat_id, s3_image_url, prediction_id):
-                self.send_text(chat_id, f"🔄 Your image is being processed... Request ID: {prediction_id[:8]}")
-                logger.info(f"✅ YOLO processing queued for prediction {prediction_id}")
-            else:
-                # Fallback to sync processing if SQS fails
-                logger.warning("⚠️ SQS failed, falling back to sync processing")
-                self.apply_yolo_sync(chat_id, photo_path)
-
-        except Exception:
-            logger.exception("YOLO async processing failed")
-            self.send_text(chat_id, "Failed to process image with YOLO.")
+        with tracer.start_as_current_span('yolo.request_async', attributes={'chat.id': chat_id}) as span:
+            try:
+                bucket_name = os.getenv("S3_BUCKET_NAME")
+                if not bucket_name:
+                    self.send_text(chat_id, "S3 bucket not configured. Contact admin.")
+                    return
+
+                user_id = chat_id
+                timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+                prediction_id = str(uuid.uuid4())
+                span.set_attribute('prediction_id', prediction_id)
+
+                # Upload image to S3
+                s3_key = f"images/{user_id}/{timestamp}-{os.path.basename(photo_path)}"
+                s3_image_url = self.upload_file_to_s3(photo_path, bucket_name, s3_key)
+
+                if not s3_image_url:
+                    self.send_text(chat_id, "Failed to upload image. Please try again.")
+                    return
+
+                # Send to YOLO queue for async processing
+                if self.send_to_yolo_queue(chat_id, s3_image_url, prediction_id):
+                    self.send_text(chat_id, f"🔄 Your image is being processed... Request ID: {prediction_id[:8]}")
+                    logger.info(f"✅ YOLO processing queued for prediction {prediction_id}")
+                else:
+                    # Fallback to sync processing if SQS fails
+                    logger.warning("⚠️ SQS failed, falling back to sync processing")
+                    self.apply_yolo_sync(chat_id, photo_path)
+
+            except Exception as e:
+                logger.exception("YOLO async processing failed")
+                mark_error(e, span)
+                self.send_text(chat_id, "Failed to process image with YOLO.")
 
     def apply_yolo_sync(self, chat_id, photo_path):
         """Fallback sync YOLO processing (original method)"""
-        try:
-            bucket_name = os.getenv("S3_BUCKET_NAME")
-            if not bucket_name:
-                self.send_text(chat_id, "S3 bucket not configured. Contact admin.")
-                return
-
-            user_id = chat_id
-            timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
-
-            original_s3_key = f"original/{user_id}/{timestamp}-{os.path.basename(photo_path)}"
-            self.upload_file_to_s3(photo_path, bucket_name, original_s3_key)
-
-            with open(photo_path, "rb") as f:
-                files = {"file": (os.path.basename(photo_path), f, "image/jpeg")}
-                headers = {"X-User-ID": str(user_id)}
-                response = requests.post(f"{self.yolo_service_url}/predict", files=files, headers=headers)
-
-            response.raise_for_status()
-            result = response.json()
-            logger.info(f"YOLO raw response: {result}")
-
-            labels = result.get("labels", [])
-            prediction_uid = result.get("prediction_uid")
-            if not labels or not prediction_uid:
-                self.send_text(chat_id, "No objects detected.")
-                return
-
-            predicted_image_url = f"{self.yolo_service_url}/prediction/{prediction_uid}/image"
-            predicted_response = requests.get(predicted_image_url, headers={"Accept": "image/jpeg"})
-            predicted_response.raise_for_status()
-
-            predicted_img_path = f"{timestamp}_predicted.jpg"
-            with open(predicted_img_path, 'wb') as f:
-                f.write(predicted_response.content)
-
-            predicted_s3_key = f"predicted/{user_id}/{predicted_img_path}"
-            self.upload_file_to_s3(predicted_img_path, bucket_name, predicted_s3_key)
-
-            result_text = "Detected objects:\n" + "\n".join(labels)
-            self.send_text(chat_id, result_text)
-            time.sleep(1)
-            self.send_photo(chat_id, predicted_img_path)
-
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Request to YOLO service failed: {e}")
-            self.send_text(chat_id, "YOLO service is not available right now.")
-
-        except Exception:
-            logger.exception("YOLO prediction failed")
-            self.send_text(chat_id, "Failed to process image with YOLO.")
+        with tracer.start_as_current_span('yolo.predict_sync', attributes={'chat.id': chat_id}) as span:
+            try:
+                bucket_name = os.getenv("S3_BUCKET_NAME")
+                if not bucket_name:
+                    self.send_text(chat_id, "S3 bucket not configured. Contact admin.")
+                    return
+
+                user_id = chat_id
+                timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+
+                original_s3_key = f"original/{user_id}/{timestamp}-{os.path.basename(photo_path)}"
+                self.upload_file_to_s3(photo_path, bucket_name, original_s3_key)
+
+                with open(photo_path, "rb") as f:
+                    files = {"file": (os.path.basename(photo_path), f, "image/jpeg")}
+                    headers = {"X-User-ID": str(user_id)}
+                    response = requests.post(f"{self.yolo_service_url}/predict", files=files, headers=headers)
+
+                response.raise_for_status()
+                result = response.json()
+                logger.info(f"YOLO raw response: {result}")
+
+                labels = result.get("labels", [])
+                prediction_uid = result.get("prediction_uid")
+                if not labels or not prediction_uid:
+                    self.send_text(chat_id, "No objects detected.")
+                    return
+
+                predicted_image_url = f"{self.yolo_service_url}/prediction/{prediction_uid}/image"
+                predicted_response = requests.get(predicted_image_url, headers={"Accept": "image/jpeg"})
+                predicted_response.raise_for_status()
+
+                predicted_img_path = f"{timestamp}_predicted.jpg"
+                with open(predicted_img_path, 'wb') as f:
+                    f.write(predicted_response.content)
+
+                predicted_s3_key = f"predicted/{user_id}/{predicted_img_path}"
+                self.upload_file_to_s3(predicted_img_path, bucket_name, predicted_s3_key)
+
+                result_text = "Detected objects:\n" + "\n".join(labels)
+                self.send_text(chat_id, result_text)
+                time.sleep(1)
+                self.send_photo(chat_id, predicted_img_path)
+
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Request to YOLO service failed: {e}")
+                mark_error(e, span)
+                self.send_text(chat_id, "YOLO service is not available right now.")
+
+            except Exception as e:
+                logger.exception("YOLO prediction failed")
+                mark_error(e, span)
+                self.send_text(chat_id, "Failed to process image with YOLO.")
+
+    def _add_to_media_group(self, msg, photo=None, retry_after=None):
+        """
+        Collect an album photo until none has arrived for 2 seconds. Without `photo` the update
+        was rejected by admission, and the whole album is rejected when it is flushed.
+        """
+        caption = self._caption_of(msg)
+        group = self.media_groups.setdefault(msg['media_group_id'], {
+            'chat_id': msg['chat']['id'],
+            'photos': [],
+            'filter': caption if caption else None,
+            'timer': None,
+            'rejected': False,
+            'retry_after': None
+        })
+        if photo:
+            group['photos'].append(photo)
+        else:
+            group['rejected'] = True
+            group['retry_after'] = retry_after
+        if caption:
+            group['filter'] = caption
+        if group['timer']:
+            group['timer'].cancel()
+        timer = threading.Timer(2.0, bind_context(self._process_media_group), args=(msg['media_group_id'],))
+        group['timer'] = timer
+        timer.start()
+
+    @staticmethod
+    def _remove_photos(photos):
+        for photo_path, _ in photos:
+            try:
+                os.remove(photo_path)
+            except OSError:
+                pass
 
     def _process_media_group(self, media_group_id):
         """Process media group"""
@@ -331,13 +438,31 @@ class ImageProcessingBot(Bot):
         photos = group['photos']
         filter_name = group['filter']
 
+        if group['rejected']:
+            logger.warning(f"🚦 Rejected album of {len(photos)} from chat {chat_id}")
+            self._remove_photos(photos)
+            self._reply_rejected(chat_id, group['retry_after'], what='albums')
+            return
+
         if not filter_name:
+            self._remove_photos(photos)
             self.send_text(chat_id, "You need to choose a filter for the media group.")
             return
 
-        if filter_name == 'yolo':
-            for photo_path in photos:
-                self.apply_yolo_async(chat_id, photo_path)
-        else:
-            for photo_path in photos:
-                self.apply_filter_from_caption(chat_id, photo_path, filter_name)
\ No newline at end of file
+        # The whole album is charged to the chat's bucket at once, then each photo goes through
+        # the fair queue so a big album is interleaved with other chats' work.
+        complexity = self._complexity_of(filter_name)
+        costs = [estimate_cost(pixels, complexity) for _, pixels in photos]
+        admitted, retry_after = self.admission.admit(chat_id, sum(costs), jobs=len(photos))
+        if not admitted:
+            logger.warning(f"🚦 Rejected album of {len(photos)} from chat {chat_id} (cost {sum(costs):.2f}, retry after {retry_after})")
+            self._remove_photos(photos)
+            self._reply_rejected(chat_id, retry_after, what='albums')
+            return
+
+        for (photo_path, _), cost in zip(photos, costs):
+            if filter_name == 'yolo':
+                job = functools.partial(self.apply_yolo_async, chat_id, photo_path)
+            else:
+                job = functools.partial(self.apply_filter_from_caption, chat_id, photo_path, filter_name)
+            self.admission.submit(chat_id, cost, job)
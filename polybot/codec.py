@@ -0,0 +1,66 @@
+from pathlib import Path
+from PIL import Image
+
+DEFAULT_JPEG_QUALITY = 75
+DEFAULT_PNG_COMPRESS_LEVEL = 6
+
+
+def decode_gray(path, max_size=None):
+    """
+    Decode an image file straight to 8-bit grayscale rows (one bytearray per row).
+    For JPEGs the decoder outputs the luma channel only and, when max_size is smaller
+    than the image, uses its reduced-size (DCT scaling) decode instead of decoding at full size.
+    """
+    with Image.open(path) as im:
+        target = (max_size, max_size) if max_size else im.size
+        # No-op for formats other than JPEG
+        im.draft('L', target)
+        gray = im.convert('L')
+
+    if max_size and max(gray.size) > max_size:
+        gray.thumbnail((max_size, max_size))
+
+    width, height = gray.size
+    buf = gray.tobytes()
+    return [bytearray(buf[i * width:(i + 1) * width]) for i in range(height)]
+
+
+def _to_bytes(data):
+    """
+    Flatten rows to bytes, stretching the value range to 0-255 the way
+    matplotlib's imsave(cmap='gray') autoscaled it.
+    """
+    lo = min(min(row) for row in data)
+    hi = max(max(row) for row in data)
+
+    if isinstance(lo, int) and isinstance(hi, int) and 0 <= lo and hi <= 255:
+        try:
+            raw = b''.join(bytes(row) for row in data)
+        except (TypeError, ValueError):
+            raw = None
+        if raw is not None:
+            if (lo, hi) == (0, 255) or lo == hi:
+                return raw
+            lut = bytes(min(255, max(0, round((v - lo) * 255 / (hi - lo)))) for v in range(256))
+            return raw.translate(lut)
+
+    scale = 255 / (hi - lo) if hi != lo else 0
+    return bytes(round((p - lo) * scale) for row in data for p in row)
+
+
+def encode_gray(data, path, quality=None):
+    """
+    Write grayscale rows as a single-channel image; the format follows the file suffix.
+    """
+    path = Path(path)
+    height, width = len(data), len(data[0])
+    im = Image.frombytes('L', (width, height), _to_bytes(data))
+
+    suffix = path.suffix.lower()
+    if suffix in ('.jpg', '.jpeg'):
+        im.save(path, format='JPEG', quality=quality or DEFAULT_JPEG_QUALITY, optimize=True)
+    elif suffix == '.png':
+        im.save(path, format='PNG', compress_level=DEFAULT_PNG_COMPRESS_LEVEL)
+    else:
+        im.save(path)
+    return path
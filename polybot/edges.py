@@ -0,0 +1,80 @@
+import numpy as np
+
+SOBEL_SMOOTH = (1, 2, 1)
+SOBEL_DIFF = (-1, 0, 1)
+
+GRADIENT_MODES = ('horizontal', 'vertical', 'magnitude')
+EDGE_MODES = ('difference',) + GRADIENT_MODES
+DEFAULT_BAND_SIZE = 64
+
+
+def separable_convolve(window, vertical, horizontal):
+    """
+    Convolve a band of rows with the separable kernel vertical x horizontal.
+    `window` carries len(vertical) - 1 halo rows, so the result has that many fewer rows;
+    columns are edge-padded so the width is kept.
+    """
+    rows = window.shape[0] - len(vertical) + 1
+    acc = sum(weight * window[k:k + rows] for k, weight in enumerate(vertical) if weight)
+
+    radius = len(horizontal) // 2
+    padded = np.pad(acc, ((0, 0), (radius, radius)), mode='edge')
+    width = acc.shape[1]
+    return sum(weight * padded[:, k:k + width] for k, weight in enumerate(horizontal) if weight)
+
+
+def _gradient_band(band, mode):
+    window = np.frombuffer(b''.join(band), dtype=np.uint8).reshape(len(band), -1).astype(np.int32)
+
+    if mode == 'horizontal':
+        out = np.abs(separable_convolve(window, SOBEL_SMOOTH, SOBEL_DIFF))
+    elif mode == 'vertical':
+        out = np.abs(separable_convolve(window, SOBEL_DIFF, SOBEL_SMOOTH))
+    else:
+        gx = separable_convolve(window, SOBEL_SMOOTH, SOBEL_DIFF)
+        gy = separable_convolve(window, SOBEL_DIFF, SOBEL_SMOOTH)
+        out = np.rint(np.hypot(gx, gy))
+
+    for row in np.clip(out, 0, 255).astype(np.uint8):
+        yield bytearray(row.tobytes())
+
+
+def gradient_rows(rows, mode='magnitude', band_size=DEFAULT_BAND_SIZE):
+    """
+    Stream 3x3 Sobel gradients ('horizontal', 'vertical' or 'magnitude') over an iterable of rows.
+    Rows are consumed band_size at a time with a one-row halo on each side (edges replicated),
+    so at most band_size + 2 input rows are held at once and the width is kept.
+    """
+    if mode not in GRADIENT_MODES:
+        raise ValueError(f"Gradient mode must be one of {', '.join(GRADIENT_MODES)}.")
+
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return
+
+    band = [first, first]
+    for row in rows:
+        band.append(row)
+        if len(band) == band_size + 2:
+            yield from _gradient_band(band, mode)
+            band = band[-2:]
+
+    band.append(band[-1])
+    yield from _gradient_band(band, mode)
+
+
+def difference_rows(rows):
+    """
+    Absolute difference between horizontal neighbours; each row gets one pixel narrower.
+    """
+    for row in rows:
+        yield bytearray(map(lambda a, b: abs(a - b), row, row[1:]))
+
+
+def edge_rows(rows, mode='difference', band_size=DEFAULT_BAND_SIZE):
+    if mode == 'difference':
+        return difference_rows(rows)
+    if mode in GRADIENT_MODES:
+        return gradient_rows(rows, mode, band_size=band_size)
+    raise ValueError(f"Edge mode must be one of {', '.join(EDGE_MODES)}.")
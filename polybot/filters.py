@@ -0,0 +1,116 @@
+import math
+from polybot.edges import EDGE_MODES
+
+
+class FilterError(ValueError):
+    """
+    Raised when a caption doesn't name a known filter or its parameters are invalid.
+    The message is meant to be shown to the user.
+    """
+
+
+class FilterParam:
+    def __init__(self, name, type, default, min_value=None, max_value=None, choices=None):
+        self.name = name
+        self.type = type
+        self.default = default
+        self.min_value = min_value
+        self.max_value = max_value
+        self.choices = choices
+
+    def parse(self, token):
+        try:
+            value = self.type(token)
+        except ValueError:
+            raise FilterError(f"'{token}' is not a valid {self.name}.")
+        # nan and inf would slip through the range check below
+        if isinstance(value, float) and not math.isfinite(value):
+            raise FilterError(f"'{token}' is not a valid {self.name}.")
+
+        if (self.min_value is not None and value < self.min_value) or \
+                (self.max_value is not None and value > self.max_value):
+            raise FilterError(f"{self.name} must be between {self.min_value} and {self.max_value}.")
+        if self.choices is not None and value not in self.choices:
+            raise FilterError(f"{self.name} must be one of {', '.join(self.choices)}.")
+        return value
+
+
+class FilterSpec:
+    """
+    A named filter: the Img method implementing it, its positional caption parameters
+    and its per-pixel cost relative to rotate (a number, or a callable taking the parameters).
+    """
+
+    def __init__(self, name, method, params=(), complexity=1, aliases=()):
+        self.name = name
+        self.method = method
+        self.params = params
+        self.complexity = complexity
+        self.aliases = aliases
+
+    def parse_args(self, tokens):
+        if len(tokens) > len(self.params):
+            raise FilterError(f"'{self.name}' takes at most {len(self.params)} parameter(s).")
+
+        kwargs = {param.name: param.default for param in self.params}
+        for param, token in zip(self.params, tokens):
+            kwargs[param.name] = param.parse(token)
+        return kwargs
+
+    def cost(self, **params):
+        return self.complexity(**params) if callable(self.complexity) else self.complexity
+
+    def apply(self, img, **params):
+        # Looked up at call time so Img methods can be patched in tests
+        getattr(img, self.method)(**params)
+
+    def usage(self):
+        return ' '.join([self.name] + [f'[{param.name}]' for param in self.params])
+
+
+FILTERS = {}
+
+
+def register_filter(spec):
+    for name in (spec.name, *spec.aliases):
+        FILTERS[name] = spec
+    return spec
+
+
+def get_filter(name):
+    spec = FILTERS.get(name)
+    if spec is None:
+        raise FilterError(f"Unknown filter '{name}'.")
+    return spec
+
+
+def parse_caption(caption):
+    """
+    Parse captions like 'blur 4' or 'segment 150' into (FilterSpec, kwargs).
+    Filter names may be several words long, e.g. 'salt and pepper 0.1'.
+    """
+    tokens = caption.split()
+    for i in range(len(tokens), 0, -1):
+        spec = FILTERS.get(' '.join(tokens[:i]))
+        if spec is not None:
+            return spec, spec.parse_args(tokens[i:])
+
+    raise FilterError(f"Unknown filter '{caption}'.")
+
+
+def available_filters():
+    return sorted({spec.usage() for spec in FILTERS.values()})
+
+
+# Complexities are per-pixel run times relative to rotate, measured on a 660x660 photo.
+register_filter(FilterSpec('blur', 'blur', params=(FilterParam('blur_level', int, 16, 1, 64),), complexity=20))
+register_filter(FilterSpec('contour', 'contour', params=(FilterParam('mode', str, 'difference', choices=EDGE_MODES),
+                                                         FilterParam('blur_level', int, 0, 0, 64)),
+                           complexity=lambda mode, blur_level: (10 if mode == 'difference' else 5) + (20 if blur_level else 0)))
+register_filter(FilterSpec('rotate', 'rotate', complexity=1))
+register_filter(FilterSpec('segment', 'segment', params=(FilterParam('threshold', int, 100, 0, 255),), complexity=1))
+register_filter(FilterSpec('salt and pepper', 'salt_n_pepper', params=(FilterParam('amount', float, 0.2, 0.0, 0.5),),
+                           complexity=15, aliases=('salt_n_pepper',)))
+register_filter(FilterSpec('sharpen', 'sharpen', params=(FilterParam('strength', float, 1.0, 0.0, 5.0),), complexity=1))
+register_filter(FilterSpec('edges', 'sobel', complexity=5, aliases=('sobel',)))
+register_filter(FilterSpec('equalize', 'equalize', complexity=1, aliases=('histogram equalization',)))
@@ -0,0 +1,57 @@
+import argparse
+import json
+from loguru import logger
+from polybot.loadtest.runner import DEFAULT_IMAGE, DEFAULT_MIX, LoadTest, LoadTestConfig, format_report
+
+
+def parse_mix(value):
+    """
+    Parse 'photo=0.6,album=0.1,duplicate=0.1,yolo=0.2' into a dict of weights.
+    """
+    mix = {}
+    for part in value.split(','):
+        kind, _, weight = part.partition('=')
+        if kind not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown traffic kind '{kind}', expected one of {', '.join(DEFAULT_MIX)}")
+        mix[kind] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay webhook traffic against polybot.app with fake Telegram, S3, SQS and YOLO services.')
+    parser.add_argument('--requests', type=int, default=200, help='number of webhook updates to post')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent webhook requests')
+    parser.add_argument('--chats', type=int, default=20, help='number of distinct chats sending traffic')
+    parser.add_argument('--image', default=DEFAULT_IMAGE, help='photo served by the fake Telegram')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help='traffic mix, e.g. photo=0.6,album=0.1,duplicate=0.1,yolo=0.2')
+    parser.add_argument('--telegram-latency', type=float, default=0.02, help='seconds per Telegram API call')
+    parser.add_argument('--s3-latency', type=float, default=0.05, help='seconds per S3 upload')
+    parser.add_argument('--sqs-latency', type=float, default=0.02, help='seconds per SQS send')
+    parser.add_argument('--yolo-latency', type=float, default=0.3, help='seconds per YOLO prediction')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='probability that any fake service call fails')
+    parser.add_argument('--sample-interval', type=float, default=0.5, help='seconds between memory samples')
+    parser.add_argument('--drain-timeout', type=float, default=30, help='seconds to wait for albums and queued work after the last request')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the report as JSON to this path')
+    parser.add_argument('--verbose', action='store_true', help='keep the bot\'s own logging')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logger.remove()
+
+    config = LoadTestConfig(
+        requests=args.requests, concurrency=args.concurrency, chats=args.chats, image=args.image, mix=args.mix,
+        telegram_latency=args.telegram_latency, s3_latency=args.s3_latency, sqs_latency=args.sqs_latency,
+        yolo_latency=args.yolo_latency, error_rate=args.error_rate, sample_interval=args.sample_interval,
+        drain_timeout=args.drain_timeout, seed=args.seed,
+    )
+    report = LoadTest(config).run()
+    print(format_report(report))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
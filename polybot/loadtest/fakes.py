@@ -0,0 +1,186 @@
+import itertools
+import queue
+import random
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+import requests
+
+
+class FakeServiceError(Exception):
+    pass
+
+
+class FakeService:
+    """
+    Base for the in-process stand-ins: every call waits `latency` seconds
+    (+/- `jitter` fraction) and fails with probability `error_rate`.
+    """
+
+    name = 'service'
+
+    def __init__(self, latency=0.0, jitter=0.2, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def _call(self, operation):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency * (1 + self.random.uniform(-self.jitter, self.jitter))
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            raise FakeServiceError(f"Injected {self.name} failure in {operation}")
+
+    def stats(self):
+        return {'calls': self.calls, 'errors': self.errors}
+
+
+class FakeTelegram(FakeService):
+    """
+    Stands in for telebot.TeleBot: serves photo downloads from memory and records replies.
+    """
+
+    name = 'telegram'
+
+    def __init__(self, photo_bytes, **kwargs):
+        super().__init__(**kwargs)
+        self.photo_bytes = photo_bytes
+        self.sent_messages = []
+        self.sent_photos = 0
+
+    def __call__(self, token, *args, **kwargs):
+        # Used as a replacement for the TeleBot class
+        return self
+
+    def get_me(self):
+        return {'id': 0, 'is_bot': True, 'username': 'LoadTestBot'}
+
+    def remove_webhook(self):
+        return True
+
+    def set_webhook(self, url, timeout=None):
+        return True
+
+    def get_file(self, file_id):
+        self._call('get_file')
+        return SimpleNamespace(file_path=f'photos/{file_id}.jpg')
+
+    def download_file(self, file_path):
+        self._call('download_file')
+        return self.photo_bytes
+
+    def send_message(self, chat_id, text, **kwargs):
+        self._call('send_message')
+        with self._lock:
+            self.sent_messages.append((chat_id, text))
+
+    def send_photo(self, chat_id, photo, **kwargs):
+        self._call('send_photo')
+        with self._lock:
+            self.sent_photos += 1
+
+    def stats(self):
+        return {**super().stats(), 'messages': len(self.sent_messages), 'photos': self.sent_photos}
+
+
+class FakeS3(FakeService):
+    name = 's3'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.objects = set()
+
+    def upload_file(self, local_path, bucket_name, s3_key):
+        self._call('upload_file')
+        with self._lock:
+            self.objects.add((bucket_name, s3_key))
+
+
+class FakeSQS(FakeService):
+    name = 'sqs'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.messages = queue.Queue()
+        self._ids = itertools.count(1)
+
+    def get_queue_url(self, QueueName):
+        return {'QueueUrl': f'https://sqs.fake/{QueueName}'}
+
+    def send_message(self, QueueUrl, MessageBody, MessageAttributes=None):
+        self._call('send_message')
+        self.messages.put((MessageBody, MessageAttributes or {}))
+        return {'MessageId': str(next(self._ids))}
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, content=b'', json_data=None):
+        self.status_code = status_code
+        self.content = content
+        self._json = json_data
+
+    def json(self):
+        return self._json
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} from fake YOLO service", response=self)
+
+
+class FakeYolo(FakeService):
+    """
+    Stands in for the YOLO service: answers the HTTP calls the bot makes
+    (requests.get/post) and consumes SQS requests, calling back /yolo-result.
+    """
+
+    name = 'yolo'
+    labels = ['person', 'guitar', 'car', 'dog']
+
+    def __init__(self, photo_bytes, **kwargs):
+        super().__init__(**kwargs)
+        self.photo_bytes = photo_bytes
+
+    def _fail_status(self, operation):
+        try:
+            self._call(operation)
+        except FakeServiceError:
+            return 500
+        return 200
+
+    def get(self, url, headers=None, timeout=None, **kwargs):
+        return FakeResponse(self._fail_status('get_image'), content=self.photo_bytes)
+
+    def post(self, url, files=None, headers=None, timeout=None, **kwargs):
+        status = self._fail_status('predict')
+        return FakeResponse(status, json_data={
+            'prediction_uid': str(uuid.uuid4()),
+            'labels': self.random.sample(self.labels, 2),
+        })
+
+    def result_for(self, request):
+        """
+        Build the /yolo-result callback payload for a queued yolo_request.
+        """
+        try:
+            self._call('predict')
+            result = {'status': 'success', 'labels': self.random.sample(self.labels, 2)}
+        except FakeServiceError as e:
+            result = {'status': 'error', 'error': str(e)}
+
+        return {
+            'chat_id': request['chat_id'],
+            'prediction_id': request['prediction_id'],
+            'trace_context': request.get('trace_context', {}),
+            **result,
+        }
@@ -0,0 +1,346 @@
+import itertools
+import json
+import os
+import random
+import resource
+import statistics
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from unittest.mock import patch
+from loguru import logger
+from PIL import Image
+from polybot.admission import AdmissionController
+from polybot.filters import FILTERS
+from polybot.loadtest.fakes import FakeS3, FakeSQS, FakeTelegram, FakeYolo
+
+DEFAULT_IMAGE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'test', 'beatles.jpeg')
+WEBHOOK_TOKEN = 'loadtest-token'
+CALLBACK_KIND = 'yolo_callback'
+
+DEFAULT_MIX = {
+    'photo': 0.6,
+    'album': 0.1,
+    'duplicate': 0.1,
+    'yolo': 0.2,
+}
+
+# Captions users actually send, including parameterised ones
+CAPTIONS = sorted(FILTERS) + ['blur 4', 'segment 150', 'salt and pepper 0.05', 'sharpen 2']
+
+
+class LoadTestConfig:
+    def __init__(self, requests=200, concurrency=8, chats=20, image=DEFAULT_IMAGE, mix=None,
+                 telegram_latency=0.02, s3_latency=0.05, sqs_latency=0.02, yolo_latency=0.3,
+                 error_rate=0.0, sample_interval=0.5, drain_timeout=30, seed=0):
+        self.requests = requests
+        self.concurrency = concurrency
+        self.chats = chats
+        self.image = image
+        self.mix = mix or DEFAULT_MIX
+        self.telegram_latency = telegram_latency
+        self.s3_latency = s3_latency
+        self.sqs_latency = sqs_latency
+        self.yolo_latency = yolo_latency
+        self.error_rate = error_rate
+        self.sample_interval = sample_interval
+        self.drain_timeout = drain_timeout
+        self.seed = seed
+
+
+class TrafficGenerator:
+    """
+    Produces Telegram webhook updates: single photos, albums, duplicate update_ids and yolo captions.
+    A few chats are much busier than the rest, like in production.
+    """
+
+    def __init__(self, config, width, height):
+        self.config = config
+        self.width = width
+        self.height = height
+        self.random = random.Random(config.seed)
+        # Start from a fresh range so repeated runs in one process aren't treated as duplicates
+        self.update_ids = itertools.count(int(time.time() * 1000))
+        self.file_ids = itertools.count(1)
+        # Updates whose webhook post has returned; only these can be redelivered as duplicates
+        self.posted = []
+        self._lock = threading.Lock()
+        chat_ids = [1000 + i for i in range(config.chats)]
+        self.chat_ids = chat_ids
+        self.chat_weights = [1 / (rank + 1) for rank in range(len(chat_ids))]
+
+    def _chat_id(self):
+        return self.random.choices(self.chat_ids, weights=self.chat_weights)[0]
+
+    def _photo_message(self, chat_id, caption=None, media_group_id=None):
+        file_id = f'loadtest-{next(self.file_ids)}'
+        msg = {
+            'message_id': self.random.randint(1, 10 ** 6),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'date': int(time.time()),
+            'photo': [{'file_id': file_id, 'file_unique_id': file_id, 'width': self.width, 'height': self.height}],
+        }
+        if caption is not None:
+            msg['caption'] = caption
+        if media_group_id is not None:
+            msg['media_group_id'] = media_group_id
+        return msg
+
+    def _update(self, msg):
+        return {'update_id': next(self.update_ids), 'message': msg}
+
+    def mark_posted(self, update):
+        with self._lock:
+            self.posted.append(update)
+
+    def next_batch(self):
+        """
+        Next list of (kind, update) to post; albums produce several updates.
+        """
+        kind = self.random.choices(list(self.config.mix), weights=list(self.config.mix.values()))[0]
+        chat_id = self._chat_id()
+
+        if kind == 'duplicate':
+            with self._lock:
+                original = self.random.choice(self.posted) if self.posted else None
+            if original is not None:
+                return [('duplicate', original)]
+        if kind == 'album':
+            media_group_id = str(next(self.update_ids))
+            caption = self.random.choice(CAPTIONS)
+            size = self.random.randint(2, 5)
+            return [('album', self._update(self._photo_message(chat_id, caption if i == 0 else None, media_group_id)))
+                    for i in range(size)]
+        if kind == 'yolo':
+            return [('yolo', self._update(self._photo_message(chat_id, 'yolo')))]
+        return [('photo', self._update(self._photo_message(chat_id, self.random.choice(CAPTIONS))))]
+
+
+def rss_mb():
+    """
+    Current resident set size; falls back to the peak where /proc is unavailable.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        # ru_maxrss is KB on Linux and bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+class LoadTest:
+    def __init__(self, config):
+        self.config = config
+        with open(config.image, 'rb') as f:
+            self.photo_bytes = f.read()
+        with Image.open(config.image) as im:
+            width, height = im.size
+
+        fake_kwargs = {'error_rate': config.error_rate, 'seed': config.seed}
+        self.telegram = FakeTelegram(self.photo_bytes, latency=config.telegram_latency, **fake_kwargs)
+        self.s3 = FakeS3(latency=config.s3_latency, **fake_kwargs)
+        self.sqs = FakeSQS(latency=config.sqs_latency, **fake_kwargs)
+        self.yolo = FakeYolo(self.photo_bytes, latency=config.yolo_latency, **fake_kwargs)
+        self.traffic = TrafficGenerator(config, width, height)
+
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.memory = []
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    @contextmanager
+    def _fake_environment(self):
+        """
+        Point polybot.app at the fakes and run it from a scratch directory,
+        since downloaded photos are written relative to the working directory.
+        """
+        clients = {'s3': self.s3, 'sqs': self.sqs}
+        env = {
+            'TELEGRAM_BOT_TOKEN': WEBHOOK_TOKEN,
+            'YOLO_SERVICE_URL': 'http://yolo.fake',
+            'BOT_APP_URL': 'http://polybot.fake',
+            'S3_BUCKET_NAME': 'loadtest-bucket',
+        }
+        cwd = os.getcwd()
+        with ExitStack() as stack:
+            workdir = stack.enter_context(tempfile.TemporaryDirectory(prefix='polybot-loadtest-'))
+            stack.enter_context(patch.dict(os.environ, env))
+            stack.enter_context(patch('telebot.TeleBot', self.telegram))
+            stack.enter_context(patch('boto3.client', lambda service, *args, **kwargs: clients[service]))
+            stack.enter_context(patch('requests.get', self.yolo.get))
+            stack.enter_context(patch('requests.post', self.yolo.post))
+            os.chdir(workdir)
+            try:
+                from polybot import app as app_module
+                # If polybot.app was imported before, its bot still holds the old clients
+                bot = app_module.bot
+                bot.telegram_bot_client = self.telegram
+                bot.sqs = self.sqs
+                bot.queue_url = self.sqs.get_queue_url(QueueName=bot.queue_name)['QueueUrl']
+                bot.admission.stop()
+                bot.admission = AdmissionController()
+                bot.admission.start()
+                yield app_module
+            finally:
+                os.chdir(cwd)
+
+    def _record(self, kind, started, status):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies[kind].append(elapsed)
+            self.statuses[kind][status] += 1
+
+    def _post(self, client, kind, url, payload):
+        started = time.perf_counter()
+        try:
+            status = client.post(url, json=payload).status_code
+        except Exception:
+            status = 'exception'
+        self._record(kind, started, status)
+
+    def _sample_memory(self, started):
+        while not self._done.wait(self.config.sample_interval):
+            self.memory.append((round(time.perf_counter() - started, 2), round(rss_mb(), 1)))
+
+    def _deliver_yolo_results(self, app_module):
+        """
+        Fake YOLO worker: consume SQS requests and call /yolo-result back.
+        """
+        client = app_module.app.test_client()
+        while not (self._done.is_set() and self.sqs.messages.empty()):
+            try:
+                body, _ = self.sqs.messages.get(timeout=0.1)
+            except Exception:
+                continue
+            self._post(client, CALLBACK_KIND, '/yolo-result', self.yolo.result_for(json.loads(body)))
+
+    def _wait_for_background_work(self, bot, timeout=30):
+        """
+        Wait for albums, queued jobs and YOLO requests to finish.
+        Returns what was still outstanding when the timeout ran out, or None.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            outstanding = {
+                'albums': sum(1 for t in threading.enumerate() if isinstance(t, threading.Timer) and t.is_alive()),
+                'queued_jobs': bot.admission.scheduler.pending(),
+                'running_jobs': bot.admission.scheduler.running(),
+                'yolo_requests': self.sqs.messages.qsize(),
+            }
+            if not any(outstanding.values()):
+                return None
+            if time.monotonic() >= deadline:
+                logger.warning(f"Background work still running after {timeout}s: {outstanding}")
+                # Pending albums would otherwise fire after the fake environment is torn down
+                for media_group_id, group in list(bot.media_groups.items()):
+                    if group['timer']:
+                        group['timer'].cancel()
+                    bot.media_groups.pop(media_group_id, None)
+                return outstanding
+            time.sleep(0.1)
+
+    def run(self):
+        with self._fake_environment() as app_module:
+            started = time.perf_counter()
+            webhook_url = f'/{WEBHOOK_TOKEN}/'
+            local = threading.local()
+
+            def post_update(kind, update):
+                if not hasattr(local, 'client'):
+                    local.client = app_module.app.test_client()
+                self._post(local.client, kind, webhook_url, update)
+                if kind != 'duplicate':
+                    self.traffic.mark_posted(update)
+
+            memory_thread = threading.Thread(target=self._sample_memory, args=(started,), daemon=True)
+            yolo_thread = threading.Thread(target=self._deliver_yolo_results, args=(app_module,), daemon=True)
+            memory_thread.start()
+            yolo_thread.start()
+
+            with ThreadPoolExecutor(max_workers=self.config.concurrency) as pool:
+                posted = 0
+                while posted < self.config.requests:
+                    # The last album is cut short so exactly `requests` webhooks are posted
+                    for kind, update in self.traffic.next_batch()[:self.config.requests - posted]:
+                        pool.submit(post_update, kind, update)
+                        posted += 1
+
+            unfinished = self._wait_for_background_work(app_module.bot, timeout=self.config.drain_timeout)
+            self._done.set()
+            yolo_thread.join()
+            memory_thread.join()
+            duration = time.perf_counter() - started
+            admission = app_module.bot.admission.stats.snapshot()
+
+        return self.report(duration, admission, unfinished)
+
+    def report(self, duration, admission, unfinished=None):
+        webhooks = sum(len(values) for kind, values in self.latencies.items() if kind != CALLBACK_KIND)
+        callbacks = len(self.latencies.get(CALLBACK_KIND, []))
+        return {
+            # Work still outstanding at the end; when set, the numbers below undercount it
+            'unfinished': unfinished,
+            'duration_s': round(duration, 2),
+            'requests': webhooks,
+            'throughput_rps': round(webhooks / duration, 2) if duration else 0.0,
+            'callbacks': callbacks,
+            'callback_rps': round(callbacks / duration, 2) if duration else 0.0,
+            'latency_ms': {
+                kind: {
+                    'count': len(values),
+                    'p50': round(percentile(values, 50) * 1000, 1),
+                    'p99': round(percentile(values, 99) * 1000, 1),
+                    'mean': round(statistics.fmean(values) * 1000, 1),
+                }
+                for kind, values in sorted(self.latencies.items())
+            },
+            'status_codes': {kind: dict(codes) for kind, codes in sorted(self.statuses.items())},
+            'admission': {
+                'rejected': sum(stats['rejected'] for stats in admission.values()),
+                'deferred': sum(stats['deferred'] for stats in admission.values()),
+                'max_queue_wait_s': round(max((stats['max_wait'] for stats in admission.values()), default=0.0), 3),
+            },
+            'services': {fake.name: fake.stats() for fake in (self.telegram, self.s3, self.sqs, self.yolo)},
+            'memory_mb': self.memory,
+        }
+
+
+def format_report(report):
+    lines = []
+    if report['unfinished']:
+        lines += [f"WARNING: background work did not finish before the report was taken, "
+                  f"results are incomplete: {report['unfinished']}", '']
+    lines += [
+        f"Duration: {report['duration_s']}s  Webhooks: {report['requests']} ({report['throughput_rps']} req/s)  "
+        f"YOLO callbacks: {report['callbacks']} ({report['callback_rps']} req/s)",
+        '',
+        f"{'kind':<15}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}  status codes",
+    ]
+    for kind, stats in report['latency_ms'].items():
+        codes = ', '.join(f'{code}: {count}' for code, count in report['status_codes'][kind].items())
+        lines.append(f"{kind:<15}{stats['count']:>8}{stats['p50']:>10}{stats['p99']:>10}{stats['mean']:>10}  {codes}")
+
+    admission = report['admission']
+    lines += [
+        '',
+        f"Admission: rejected {admission['rejected']}, deferred {admission['deferred']}, "
+        f"max queue wait {admission['max_queue_wait_s']}s",
+        'Services: ' + ', '.join(f"{name} {stats}" for name, stats in report['services'].items()),
+    ]
+    if report['memory_mb']:
+        rss = [mb for _, mb in report['memory_mb']]
+        timeline = ' '.join(f'{t}s:{mb}' for t, mb in report['memory_mb'])
+        lines += ['', f"Memory RSS MB: start {rss[0]}, peak {max(rss)}, end {rss[-1]}", f"  {timeline}"]
+    return '\n'.join(lines)
@@ -0,0 +1,142 @@
+import threading
+import unittest
+from polybot.admission import AdmissionController, FairScheduler, QueueWaitStats, TokenBucket, estimate_cost
+from polybot.filters import get_filter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestAdmission(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_blur_costs_more_than_rotate(self):
+        pixels = 1000 * 1000
+        self.assertGreater(estimate_cost(pixels, get_filter('blur').cost()), estimate_cost(pixels, get_filter('rotate').cost()))
+
+    def test_token_bucket_refills(self):
+        bucket = TokenBucket(rate=1.0, capacity=2.0, clock=self.clock)
+        self.assertTrue(bucket.try_consume(2.0))
+        self.assertFalse(bucket.try_consume(1.0))
+        self.assertAlmostEqual(bucket.seconds_until(1.0), 1.0)
+
+        self.clock.now += 1.0
+        self.assertTrue(bucket.try_consume(1.0))
+
+    def test_flooding_chat_is_rejected(self):
+        admission = AdmissionController(rate=1.0, burst=5.0, clock=self.clock)
+        results = [admission.admit(1, 2.0)[0] for _ in range(3)]
+        self.assertEqual([True, True, False], results)
+
+        # Another chat has its own bucket
+        self.assertTrue(admission.admit(2, 2.0)[0])
+        self.assertEqual(1, admission.stats.snapshot()['1']['rejected'])
+
+    def test_precheck_does_not_charge(self):
+        admission = AdmissionController(rate=1.0, burst=5.0, clock=self.clock)
+        self.assertTrue(admission.precheck(1, 5.0)[0])
+        self.assertTrue(admission.admit(1, 5.0)[0])
+
+        admitted, retry_after = admission.precheck(1, 1.0)
+        self.assertFalse(admitted)
+        self.assertAlmostEqual(1.0, retry_after)
+
+    def test_album_counts_against_pending_limit(self):
+        admission = AdmissionController(max_pending_per_chat=3, clock=self.clock)
+        self.assertEqual((False, None), admission.admit(1, 1.0, jobs=4))
+        self.assertTrue(admission.admit(1, 1.0, jobs=3)[0])
+
+    def test_full_buckets_are_dropped(self):
+        admission = AdmissionController(rate=1.0, burst=5.0, clock=self.clock)
+        admission._sweep_at = 10
+        for chat_id in range(10):
+            admission.admit(chat_id, 5.0)
+
+        # Every bucket has refilled, so the next new chat sweeps them all away
+        self.clock.now += 5.0
+        admission.admit('new', 1.0)
+        self.assertEqual(['new'], list(admission._buckets))
+
+    def test_busy_buckets_are_kept(self):
+        admission = AdmissionController(rate=1.0, burst=5.0, clock=self.clock)
+        admission._sweep_at = 2
+        admission.admit(1, 5.0)
+        admission.admit(2, 5.0)
+        admission.admit(3, 1.0)
+
+        self.assertEqual([1, 2, 3], sorted(admission._buckets))
+        # The drained bucket wasn't reset by the sweep
+        self.assertFalse(admission.admit(1, 1.0)[0])
+
+    def test_wait_stats_keep_recent_chats(self):
+        stats = QueueWaitStats(max_chats=2)
+        stats.record_wait(1, 0.5)
+        stats.record_wait(2, 0.5)
+        stats.record_rejected(1)
+        stats.record_deferred(3)
+        self.assertEqual(['1', '3'], sorted(stats.snapshot()))
+
+    def test_fair_queuing_interleaves_chats(self):
+        scheduler = FairScheduler(max_workers=1, clock=self.clock)
+        order = []
+
+        # The heavy chat floods the queue before the worker starts
+        for i in range(3):
+            scheduler.submit('heavy', 10.0, lambda i=i: order.append(f'heavy{i}'))
+        scheduler.submit('light', 1.0, lambda: order.append('light'))
+
+        scheduler.start()
+        self.assertTrue(scheduler.join(timeout=5))
+        scheduler.stop()
+
+        self.assertEqual('light', order[0])
+        self.assertEqual(['heavy0', 'heavy1', 'heavy2'], order[1:])
+        # Chats with nothing queued don't keep a finish time around
+        self.assertEqual({}, scheduler._last_finish)
+
+    def test_submit_does_not_run_the_job(self):
+        scheduler = FairScheduler(max_workers=1, clock=self.clock)
+        submitter = threading.current_thread()
+        release = threading.Event()
+        ran_on = []
+
+        def job():
+            ran_on.append(threading.current_thread())
+            release.wait(5)
+
+        scheduler.start()
+        self.assertFalse(scheduler.submit('chat', 1.0, job))
+        # The worker is busy, so the next job is queued behind it
+        self.assertTrue(scheduler.submit('chat', 1.0, job))
+
+        release.set()
+        self.assertTrue(scheduler.join(timeout=5))
+        scheduler.stop()
+
+        self.assertEqual(2, len(ran_on))
+        self.assertNotIn(submitter, ran_on)
+        self.assertEqual(2, scheduler.stats.snapshot()['chat']['jobs'])
+        self.assertEqual(1, scheduler.stats.snapshot()['chat']['deferred'])
+
+    def test_failing_job_does_not_stop_the_worker(self):
+        scheduler = FairScheduler(max_workers=1, clock=self.clock)
+        ran = []
+        scheduler.start()
+        scheduler.submit('chat', 1.0, lambda: 1 / 0)
+        scheduler.submit('chat', 1.0, lambda: ran.append(True))
+        self.assertTrue(scheduler.join(timeout=5))
+        scheduler.stop()
+
+        self.assertEqual([True], ran)
+        self.assertEqual(0, scheduler.running())
+
+
+if __name__ == '__main__':
+    unittest.main()
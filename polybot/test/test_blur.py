@@ -0,0 +1,40 @@
+import unittest
+from polybot.img_proc import Img
+import os
+
+img_path = 'polybot/test/beatles.jpeg' if '/polybot/test' not in os.getcwd() else 'beatles.jpeg'
+
+
+def naive_blur(data, blur_level):
+    filter_sum = blur_level ** 2
+    return [
+        [sum(sum(row[j:j + blur_level]) for row in data[i:i + blur_level]) // filter_sum
+         for j in range(len(data[0]) - blur_level + 1)]
+        for i in range(len(data) - blur_level + 1)
+    ]
+
+
+class TestImgBlur(unittest.TestCase):
+
+    def setUp(self):
+        self.img = Img(img_path, max_size=64)
+        self.original_data = [list(row) for row in self.img.data]
+
+    def test_pixels_are_bytes(self):
+        self.assertTrue(all(isinstance(row, bytearray) for row in self.img.data))
+
+    def test_blur_dimension(self):
+        self.img.blur(4)
+        self.assertEqual(len(self.original_data) - 3, len(self.img.data))
+        self.assertEqual(len(self.original_data[0]) - 3, len(self.img.data[0]))
+
+    def test_blur_matches_window_average(self):
+        for blur_level in (1, 3, 16):
+            img = Img(img_path, max_size=64)
+            img.blur(blur_level)
+            expected = naive_blur(self.original_data, blur_level)
+            self.assertEqual(expected, [list(row) for row in img.data])
+
+
+if __name__ == '__main__':
+    unittest.main()
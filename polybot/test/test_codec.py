@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+from PIL import Image
+from polybot.codec import decode_gray, encode_gray
+
+img_path = 'polybot/test/beatles.jpeg' if '/polybot/test' not in os.getcwd() else 'beatles.jpeg'
+
+
+class TestCodec(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_decode_is_8bit_gray(self):
+        data = decode_gray(img_path)
+        with Image.open(img_path) as im:
+            self.assertEqual(im.size, (len(data[0]), len(data)))
+        self.assertTrue(all(isinstance(p, int) and 0 <= p <= 255 for row in data for p in row))
+
+    def test_reduced_size_decode(self):
+        full = decode_gray(img_path)
+        small = decode_gray(img_path, max_size=100)
+        self.assertLessEqual(max(len(small), len(small[0])), 100)
+        self.assertLess(len(small), len(full))
+
+    def test_encode_single_channel(self):
+        data = decode_gray(img_path)
+        for name in ('out.jpeg', 'out.png'):
+            path = os.path.join(self.tmp_dir.name, name)
+            encode_gray(data, path)
+            with Image.open(path) as im:
+                self.assertEqual('L', im.mode)
+                self.assertEqual((len(data[0]), len(data)), im.size)
+
+    def test_png_round_trip_is_lossless(self):
+        data = [[0, 64], [128, 255]]
+        path = os.path.join(self.tmp_dir.name, 'out.png')
+        encode_gray(data, path)
+        self.assertEqual(data, [list(row) for row in decode_gray(path)])
+
+    def test_quality_controls_jpeg_size(self):
+        data = decode_gray(img_path)
+        low = os.path.join(self.tmp_dir.name, 'low.jpeg')
+        high = os.path.join(self.tmp_dir.name, 'high.jpeg')
+        encode_gray(data, low, quality=30)
+        encode_gray(data, high, quality=95)
+        self.assertLess(os.path.getsize(low), os.path.getsize(high))
+
+
+if __name__ == '__main__':
+    unittest.main()
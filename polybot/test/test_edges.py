@@ -0,0 +1,61 @@
+import unittest
+from polybot.edges import edge_rows, gradient_rows
+from polybot.img_proc import Img, blur_rows
+import os
+
+img_path = 'polybot/test/beatles.jpeg' if '/polybot/test' not in os.getcwd() else 'beatles.jpeg'
+
+
+class TestEdges(unittest.TestCase):
+
+    def setUp(self):
+        self.img = Img(img_path, max_size=100)
+        self.original_data = [bytearray(row) for row in self.img.data]
+
+    def test_difference_mode_matches_legacy_contour(self):
+        self.img.contour()
+        expected = [[abs(row[j - 1] - row[j]) for j in range(1, len(row))] for row in self.original_data]
+        self.assertEqual(expected, [list(row) for row in self.img.data])
+
+    def test_gradient_directions(self):
+        vertical_edge = [bytearray([0, 0, 0, 255, 255, 255]) for _ in range(5)]
+        horizontal = list(gradient_rows(vertical_edge, 'horizontal'))
+        vertical = list(gradient_rows(vertical_edge, 'vertical'))
+
+        self.assertEqual([0, 0, 255, 255, 0, 0], list(horizontal[2]))
+        self.assertTrue(all(pixel == 0 for row in vertical for pixel in row))
+
+    def test_gradient_keeps_dimension(self):
+        for mode in ('horizontal', 'vertical', 'magnitude'):
+            img = Img(img_path, max_size=100)
+            img.contour(mode)
+            self.assertEqual((len(self.original_data), len(self.original_data[0])), (len(img.data), len(img.data[0])))
+
+    def test_band_size_does_not_change_result(self):
+        whole = list(gradient_rows(self.original_data, 'magnitude', band_size=len(self.original_data)))
+        for band_size in (1, 7, 64):
+            self.assertEqual(whole, list(gradient_rows(self.original_data, 'magnitude', band_size=band_size)))
+
+    def test_streaming_reads_rows_lazily(self):
+        pulled = []
+
+        def rows():
+            for row in self.original_data:
+                pulled.append(row)
+                yield row
+
+        next(gradient_rows(rows(), 'magnitude', band_size=4))
+        self.assertLessEqual(len(pulled), 5)
+
+    def test_contour_after_blur_matches_two_passes(self):
+        blurred = Img(img_path, max_size=100)
+        blurred.blur(4)
+        blurred.contour('magnitude')
+
+        self.img.contour('magnitude', blur_level=4)
+        self.assertEqual(blurred.data, self.img.data)
+        self.assertEqual(blurred.data, list(edge_rows(blur_rows(self.original_data, 4), 'magnitude')))
+
+
+if __name__ == '__main__':
+    unittest.main()
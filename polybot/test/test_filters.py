@@ -0,0 +1,75 @@
+import unittest
+from polybot.filters import FilterError, parse_caption
+from polybot.img_proc import Img
+import os
+
+img_path = 'polybot/test/beatles.jpeg' if '/polybot/test' not in os.getcwd() else 'beatles.jpeg'
+
+
+class TestFilterRegistry(unittest.TestCase):
+
+    def test_default_parameters(self):
+        spec, params = parse_caption('blur')
+        self.assertEqual('blur', spec.name)
+        self.assertEqual({'blur_level': 16}, params)
+
+    def test_caption_parameters(self):
+        self.assertEqual({'blur_level': 4}, parse_caption('blur 4')[1])
+        self.assertEqual({'threshold': 150}, parse_caption('segment 150')[1])
+        self.assertEqual({'mode': 'magnitude', 'blur_level': 4}, parse_caption('contour magnitude 4')[1])
+
+    def test_multi_word_name_and_alias(self):
+        spec, params = parse_caption('salt and pepper 0.1')
+        self.assertEqual('salt_n_pepper', spec.method)
+        self.assertEqual({'amount': 0.1}, params)
+        self.assertIs(spec, parse_caption('salt_n_pepper')[0])
+
+    def test_invalid_captions(self):
+        for caption in ('sepia', 'blur many', 'segment 300', 'rotate 90', 'contour diagonal',
+                        'sharpen nan', 'salt and pepper nan', 'sharpen inf'):
+            with self.assertRaises(FilterError):
+                parse_caption(caption)
+
+
+class TestNewFilters(unittest.TestCase):
+
+    def setUp(self):
+        self.img = Img(img_path, max_size=128)
+        self.original_dimension = (len(self.img.data), len(self.img.data[0]))
+
+    def assert_same_dimension(self):
+        self.assertEqual(self.original_dimension, (len(self.img.data), len(self.img.data[0])))
+
+    def test_segment_threshold(self):
+        original = [list(row) for row in self.img.data]
+        self.img.segment(150)
+        expected = [[255 if pixel > 150 else 0 for pixel in row] for row in original]
+        self.assertEqual(expected, [list(row) for row in self.img.data])
+
+    def test_sharpen_keeps_flat_regions(self):
+        self.img.data = [bytearray([100] * 5) for _ in range(5)]
+        self.img.sharpen()
+        self.assertTrue(all(pixel == 100 for row in self.img.data for pixel in row))
+
+    def test_sobel_finds_vertical_edge(self):
+        self.img.data = [bytearray([0, 0, 0, 255, 255, 255]) for _ in range(4)]
+        self.img.sobel()
+        self.assertEqual([0, 0, 255, 255, 0, 0], list(self.img.data[1]))
+
+    def test_equalize_spreads_histogram(self):
+        self.img.equalize()
+        self.assert_same_dimension()
+        pixels = [pixel for row in self.img.data for pixel in row]
+        self.assertEqual(0, min(pixels))
+        self.assertEqual(255, max(pixels))
+
+    def test_vectorized_filters_keep_dimension(self):
+        for method in ('sharpen', 'sobel'):
+            img = Img(img_path, max_size=128)
+            getattr(img, method)()
+            self.assertEqual(self.original_dimension, (len(img.data), len(img.data[0])))
+            self.assertTrue(all(isinstance(row, bytearray) for row in img.data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+from polybot.loadtest.runner import LoadTest, LoadTestConfig, TrafficGenerator, format_report
+
+
+class TestLoadTest(unittest.TestCase):
+
+    def run_load(self, requests=12, **kwargs):
+        config = LoadTestConfig(requests=requests, concurrency=3, chats=4, telegram_latency=0, s3_latency=0,
+                                sqs_latency=0, yolo_latency=0, sample_interval=0.05, **kwargs)
+        return LoadTest(config).run()
+
+    def test_replays_webhooks_and_yolo_callbacks(self):
+        report = self.run_load(mix={'photo': 0.5, 'duplicate': 0.2, 'yolo': 0.3})
+
+        webhook_kinds = ('photo', 'duplicate', 'yolo')
+        self.assertEqual(12, sum(report['latency_ms'].get(kind, {}).get('count', 0) for kind in webhook_kinds))
+        self.assertEqual(report['services']['sqs']['calls'], report['latency_ms'].get('yolo_callback', {}).get('count', 0))
+        for kind, codes in report['status_codes'].items():
+            self.assertEqual({200}, set(codes), kind)
+
+        self.assertEqual(12, report['requests'])
+        self.assertEqual(report['services']['sqs']['calls'], report['callbacks'])
+        self.assertGreater(report['throughput_rps'], 0)
+        self.assertIsNone(report['unfinished'])
+        self.assertIn('Webhooks: 12', format_report(report))
+
+    def test_albums_dont_overshoot_the_request_count(self):
+        report = self.run_load(mix={'album': 1.0}, requests=7)
+        self.assertEqual(7, report['requests'])
+
+    def test_injected_errors_are_reported(self):
+        report = self.run_load(mix={'photo': 1.0}, error_rate=1.0)
+        self.assertGreater(report['services']['telegram']['errors'], 0)
+        self.assertEqual(0, report['services']['telegram']['photos'])
+
+    def test_unfinished_work_is_reported(self):
+        # Albums are flushed after 2s, so a zero drain timeout leaves them outstanding
+        report = self.run_load(mix={'album': 1.0}, drain_timeout=0)
+        self.assertGreater(report['unfinished']['albums'], 0)
+        self.assertIn('WARNING', format_report(report))
+
+    def test_duplicates_only_repeat_posted_updates(self):
+        traffic = TrafficGenerator(LoadTestConfig(mix={'duplicate': 1.0}), 100, 100)
+        # Nothing has been posted yet, so there is nothing to redeliver
+        (kind, update), = traffic.next_batch()
+        self.assertEqual('photo', kind)
+
+        traffic.mark_posted(update)
+        self.assertEqual([('duplicate', update)], traffic.next_batch())
+
+
+if __name__ == '__main__':
+    unittest.main()
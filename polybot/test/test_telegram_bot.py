@@ -67,6 +67,7 @@ class TestBot(unittest.TestCase):
 
         with patch('polybot.img_proc.Img.contour') as mock_method:
             self.bot.handle_message(mock_msg)
+            self.bot.admission.join(timeout=10)
 
             mock_method.assert_called_once()
             self.bot.telegram_bot_client.send_photo.assert_called_once()
@@ -87,6 +88,7 @@ class TestBot(unittest.TestCase):
             self.bot.handle_message(mock_msg)
         except Exception as err:
             self.fail(err)
+        self.bot.admission.join(timeout=10)
 
         self.assertTrue(self.bot.telegram_bot_client.send_message.called)
 
@@ -99,6 +101,73 @@ class TestBot(unittest.TestCase):
         contains_retry = any(keyword in text.lower() for keyword in retry_keywords)
         self.assertTrue(contains_retry, f"Error message was not sent to the user. Make sure your message contains one of {retry_keywords}")
 
+    def test_image_size_and_quality_come_from_bot_config(self):
+        self.bot.max_image_size = 320
+        self.bot.jpeg_quality = 60
+        mock_msg['caption'] = 'Rotate'
+
+        with patch('polybot.bot.Img') as mock_img:
+            mock_img.return_value.save_img.return_value = img_path
+            self.bot.handle_message(mock_msg)
+            self.bot.admission.join(timeout=10)
+
+            mock_img.assert_called_once_with('photos/beatles.jpeg', max_size=320)
+            mock_img.return_value.save_img.assert_called_once_with(quality=60)
+            self.bot.telegram_bot_client.send_photo.assert_called_once()
+
+    def _album(self, size=4):
+        album = []
+        for i in range(size):
+            msg = dict(mock_msg, media_group_id='album-1', message_id=400 + i)
+            msg['photo'] = [dict(mock_msg['photo'][-1], width=1280, height=1280)]
+            if i == 0:
+                msg['caption'] = 'Blur'
+            else:
+                msg.pop('caption', None)
+            album.append(msg)
+        return album
+
+    def test_album_is_admitted_as_one_unit(self):
+        album = self._album()
+
+        with patch.object(self.bot, 'apply_filter_from_caption') as mock_apply:
+            for msg in album:
+                self.bot.handle_message(msg)
+            self.bot.media_groups['album-1']['timer'].cancel()
+            self.bot._process_media_group('album-1')
+            self.bot.admission.join(timeout=10)
+
+            self.assertEqual(4, mock_apply.call_count)
+            self.assertTrue(all(call.args[2] == 'blur' for call in mock_apply.call_args_list))
+
+    def test_album_from_flooding_chat_is_not_downloaded(self):
+        # Use up the chat's whole bucket
+        self.assertTrue(self.bot.admission.admit(mock_msg['chat']['id'], self.bot.admission.burst)[0])
+
+        with patch.object(self.bot, 'apply_filter_from_caption') as mock_apply:
+            for msg in self._album():
+                self.bot.handle_message(msg)
+            self.bot.media_groups['album-1']['timer'].cancel()
+            self.bot._process_media_group('album-1')
+
+            self.bot.telegram_bot_client.download_file.assert_not_called()
+            mock_apply.assert_not_called()
+            text = self.bot.telegram_bot_client.send_message.call_args[0][1]
+            self.assertIn('try again', text)
+
+    def test_rejected_album_photos_are_removed(self):
+        with patch.object(self.bot, 'apply_filter_from_caption') as mock_apply, \
+                patch.object(self.bot.admission, 'admit', return_value=(False, 5.0)), \
+                patch('polybot.bot.os.remove') as mock_remove:
+            for msg in self._album():
+                self.bot.handle_message(msg)
+            self.bot.media_groups['album-1']['timer'].cancel()
+            self.bot._process_media_group('album-1')
+
+            mock_apply.assert_not_called()
+            self.assertEqual(4, mock_remove.call_count)
+            mock_remove.assert_called_with('photos/beatles.jpeg')
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,53 @@
+import json
+import unittest
+from unittest.mock import patch, Mock
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from polybot.bot import ImageProcessingBot
+from polybot.tracing import tracer, extract_context
+
+exporter = InMemorySpanExporter()
+
+
+class TestTracing(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+        trace.set_tracer_provider(provider)
+
+    @patch('telebot.TeleBot')
+    def setUp(self, mock_telebot):
+        exporter.clear()
+        bot = ImageProcessingBot(token='bot_token', telegram_chat_url='webhook_url')
+        bot.sqs = Mock()
+        bot.sqs.send_message.return_value = {'MessageId': 'msg-1'}
+        bot.queue_url = 'https://sqs.example/queue'
+        self.bot = bot
+
+    def test_trace_context_travels_with_sqs_message(self):
+        with tracer.start_as_current_span('webhook') as parent:
+            self.assertTrue(self.bot.send_to_yolo_queue(42, 's3://bucket/key', 'prediction-1'))
+
+        kwargs = self.bot.sqs.send_message.call_args.kwargs
+        body = json.loads(kwargs['MessageBody'])
+        self.assertEqual('prediction-1', body['prediction_id'])
+        self.assertIn('traceparent', body['trace_context'])
+        self.assertEqual(body['trace_context']['traceparent'],
+                         kwargs['MessageAttributes']['traceparent']['StringValue'])
+
+        # A callback carrying the same trace_context continues the webhook's trace
+        callback_ctx = extract_context(body['trace_context'])
+        with tracer.start_as_current_span('yolo_result', context=callback_ctx) as callback:
+            pass
+        self.assertEqual(parent.get_span_context().trace_id, callback.get_span_context().trace_id)
+
+        send_span = next(span for span in exporter.get_finished_spans() if span.name.startswith('sqs.send'))
+        self.assertEqual(parent.get_span_context().span_id, send_span.parent.span_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
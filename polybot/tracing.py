@@ -0,0 +1,85 @@
+import functools
+import os
+from loguru import logger
+from opentelemetry import context, propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+# Proxy tracer: spans are no-ops until init_tracing() installs a provider.
+tracer = trace.get_tracer('polybot')
+
+
+def init_tracing(service_name='polybot'):
+    """
+    Install a tracer provider exporting over OTLP/HTTP (OTEL_EXPORTER_OTLP_ENDPOINT)
+    and/or as JSON lines to a local file (OTEL_TRACES_FILE).
+    Tracing stays disabled when neither is set.
+    """
+    endpoint = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')
+    traces_file = os.getenv('OTEL_TRACES_FILE')
+    if not endpoint and not traces_file:
+        logger.info("Tracing disabled: neither OTEL_EXPORTER_OTLP_ENDPOINT nor OTEL_TRACES_FILE is set")
+        return None
+
+    resource = Resource.create({
+        'service.name': os.getenv('OTEL_SERVICE_NAME', service_name),
+        'deployment.environment': os.getenv('ENVIRONMENT', 'dev').lower(),
+    })
+    provider = TracerProvider(resource=resource)
+
+    if endpoint:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        logger.info(f"✅ Exporting traces to {endpoint}")
+
+    if traces_file:
+        out = open(traces_file, 'a')
+        provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter(
+            out=out, formatter=lambda span: span.to_json(indent=None) + os.linesep
+        )))
+        logger.info(f"✅ Writing traces to {traces_file}")
+
+    trace.set_tracer_provider(provider)
+    return provider
+
+
+def inject_context():
+    """
+    Serialize the current trace context (W3C traceparent/tracestate) into a dict.
+    """
+    carrier = {}
+    propagate.inject(carrier)
+    return carrier
+
+
+def extract_context(carrier):
+    """
+    Build a parent context from a dict produced by inject_context().
+    """
+    return propagate.extract(carrier or {})
+
+
+def bind_context(func):
+    """
+    Wrap `func` so it runs under the trace context that is current now,
+    even if it is called later from another thread.
+    """
+    ctx = context.get_current()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = context.attach(ctx)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            context.detach(token)
+
+    return wrapper
+
+
+def mark_error(exc, span=None):
+    span = span or trace.get_current_span()
+    span.record_exception(exc)
+    span.set_status(Status(StatusCode.ERROR, str(exc)))